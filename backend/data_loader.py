@@ -5,82 +5,246 @@ Handles both CSV datasets, unifies schema, cleans text, and provides train/test
 
 import os
 import re
+import hashlib
+import logging
+import tempfile
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
 from sklearn.model_selection import train_test_split
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
+logger = logging.getLogger(__name__)
+
 # Paths to datasets (relative to project root)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATASET_1_PATH = os.path.join(BASE_DIR, "cyberbullying_dataset_1.csv")
 DATASET_2_PATH = os.path.join(BASE_DIR, "cyberbullying_dataset_2.csv")
 
+# On-disk cache of cleaned, subsampled datasets and their split indices.
+# Bump CLEAN_VERSION whenever the cleaning pipeline changes its output.
+CACHE_DIR = os.path.join(BASE_DIR, ".cache")
+CLEAN_VERSION = 3
+
+# Text-cleaning patterns. The column path hands the raw patterns to pyarrow (RE2);
+# clean_text uses them compiled with the stdlib re. Character classes are spelled
+# out rather than written as \s/\w, which are ASCII-only in RE2 but Unicode-aware
+# in re, so both engines clean training and prediction text identically.
+WHITESPACE = " \t\n\r\f\v"
+URL_PATTERN = rf"http[^{WHITESPACE}]+|www\.[^{WHITESPACE}]+"
+MENTION_PATTERN = r"@[A-Za-z0-9_]+"
+NONALPHA_PATTERN = rf"[^a-z{WHITESPACE}]"
+WS_PATTERN = rf"[{WHITESPACE}]+"
+
+URL_RE = re.compile(URL_PATTERN)
+MENTION_RE = re.compile(MENTION_PATTERN)
+NONALPHA_RE = re.compile(NONALPHA_PATTERN)
+WS_RE = re.compile(WS_PATTERN)
+
+
+if numba is not None:
+    @numba.njit("uint8[:](uint8[:])", cache=True, nogil=True)
+    def _filter_ascii(buf):
+        r"""
+        NONALPHA_RE + WS_RE + strip in one pass over lowercase ASCII bytes: keep a-z,
+        drop other non-whitespace, collapse whitespace runs to one space, trim ends.
+        Whitespace is the WHITESPACE set used by the patterns: \t-\r and space.
+        """
+        out = np.empty(buf.shape[0], np.uint8)
+        n = 0
+        pending_space = False
+        for b in buf:
+            if 97 <= b <= 122:
+                if pending_space and n > 0:
+                    out[n] = 32
+                    n += 1
+                pending_space = False
+                out[n] = b
+                n += 1
+            elif b == 32 or 9 <= b <= 13:
+                pending_space = True
+        return out[:n]
+else:
+    _filter_ascii = None
+
 
 def clean_text(text: str) -> str:
     """Clean a single text string: lowercase, remove URLs, mentions, special chars."""
     if not isinstance(text, str):
         return ""
     text = text.lower()
-    text = re.sub(r"http\S+|www\.\S+", "", text)          # remove URLs
-    text = re.sub(r"@\w+", "", text)                       # remove @mentions
-    text = re.sub(r"[^a-z\s]", "", text)                   # keep only letters & spaces
-    text = re.sub(r"\s+", " ", text).strip()               # collapse whitespace
+    text = URL_RE.sub("", text)                            # remove URLs
+    text = MENTION_RE.sub("", text)                        # remove @mentions
+    if _filter_ascii is not None and text.isascii():
+        # JIT-compiled char filter; non-ASCII text takes the regex path below
+        buf = np.frombuffer(bytearray(text, "ascii"), dtype=np.uint8)
+        return _filter_ascii(buf).tobytes().decode("ascii")
+    text = NONALPHA_RE.sub("", text)                       # keep only letters & spaces
+    text = WS_RE.sub(" ", text).strip()                    # collapse whitespace
     return text
 
 
-def load_dataset(dataset_id: str) -> pd.DataFrame:
+def clean_text_series(texts: pd.Series) -> pd.Series:
     """
-    Load a single dataset by id ("1", "2", or "combined").
-    Returns DataFrame with columns: text, label
+    Vectorized equivalent of clean_text for a whole column of texts.
+    Runs on an Arrow string array so the regexes are evaluated by RE2 in C,
+    without a Python call per row.
+    """
+    arr = pa.array(texts, type=pa.string(), from_pandas=True)
+    arr = pc.utf8_lower(arr)
+    arr = pc.replace_substring_regex(arr, pattern=URL_PATTERN, replacement="")
+    arr = pc.replace_substring_regex(arr, pattern=MENTION_PATTERN, replacement="")
+    arr = pc.replace_substring_regex(arr, pattern=NONALPHA_PATTERN, replacement="")
+    arr = pc.replace_substring_regex(arr, pattern=WS_PATTERN, replacement=" ")
+    arr = pc.utf8_trim_whitespace(arr)
+    return pd.Series(pd.arrays.ArrowExtensionArray(arr), index=texts.index)
+
+
+def _read_csv(path: str) -> pa.Table:
+    """
+    Read the text/label columns of a dataset CSV into an Arrow table.
+    Quoted fields may span lines; malformed rows are skipped and counted in the log.
+    """
+    skipped = []
+
+    def skip(row):
+        skipped.append(row.number)
+        return "skip"
+
+    table = pa_csv.read_csv(
+        path,
+        read_options=pa_csv.ReadOptions(use_threads=True, block_size=8 << 20),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True, invalid_row_handler=skip),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=["Text", "oh_label"],
+            column_types={"Text": pa.string(), "oh_label": pa.float64()},
+        ),
+    )
+    if skipped:
+        logger.warning("Skipped %d malformed rows in %s", len(skipped), os.path.basename(path))
+    return table
+
+
+def _load_raw(dataset_id: str) -> pd.DataFrame:
+    """
+    Read, concatenate and binarize a dataset by id ("1", "2", or "combined"),
+    dropping rows with missing text. Text is returned uncleaned.
     """
-    frames = []
+    tables = []
 
     if dataset_id in ("1", "combined"):
-        df1 = pd.read_csv(DATASET_1_PATH, on_bad_lines="skip")
-        df1 = df1[["Text", "oh_label"]].rename(columns={"Text": "text", "oh_label": "label"})
-        frames.append(df1)
+        tables.append(_read_csv(DATASET_1_PATH))
 
     if dataset_id in ("2", "combined"):
-        df2 = pd.read_csv(DATASET_2_PATH, on_bad_lines="skip")
-        df2 = df2[["Text", "oh_label"]].rename(columns={"Text": "text", "oh_label": "label"})
-        frames.append(df2)
+        tables.append(_read_csv(DATASET_2_PATH))
 
-    if not frames:
+    if not tables:
         raise ValueError(f"Unknown dataset_id: {dataset_id}")
 
-    df = pd.concat(frames, ignore_index=True)
+    table = pa.concat_tables(tables).rename_columns(["text", "label"])
 
-    # Binarize label at 0.5 threshold
-    df["label"] = (df["label"] >= 0.5).astype(int)
+    # Binarize label at 0.5 threshold (missing labels count as 0)
+    label = pc.fill_null(pc.greater_equal(table["label"], 0.5), False)
+    table = table.set_column(1, "label", pc.cast(label, pa.int64()))
+
+    df = table.to_pandas(types_mapper={pa.string(): pd.ArrowDtype(pa.string())}.get)
 
     # Drop rows with missing text
-    df = df.dropna(subset=["text"])
-    df = df[df["text"].str.strip() != ""]
+    return df.dropna(subset=["text"]).reset_index(drop=True)
+
+
+def _clean(df: pd.DataFrame) -> pd.DataFrame:
+    """Clean the text column and drop rows left empty by cleaning."""
+    text = clean_text_series(df["text"])
+    # Single post-clean filter; str.len() on Arrow strings is an offset subtraction per row
+    return df.assign(text=text)[text.str.len() > 0].reset_index(drop=True)
+
+
+def load_dataset(dataset_id: str) -> pd.DataFrame:
+    """
+    Load a single dataset by id ("1", "2", or "combined").
+    Returns DataFrame with columns: text, label
+    """
+    return _clean(_load_raw(dataset_id))
 
-    # Clean text
-    df["text"] = df["text"].apply(clean_text)
-    df = df[df["text"].str.strip() != ""]
 
-    return df.reset_index(drop=True)
+def _split_cache_path(dataset_id: str, test_size: float, max_samples: int) -> str:
+    """Return the cache file prefix for a split, keyed on its parameters and source files."""
+    mtimes = [os.path.getmtime(p) for p in (DATASET_1_PATH, DATASET_2_PATH) if os.path.exists(p)]
+    key = repr((dataset_id, max_samples, test_size, CLEAN_VERSION, mtimes))
+    return os.path.join(CACHE_DIR, hashlib.sha1(key.encode()).hexdigest())
+
+
+def _write_split_cache(df: pd.DataFrame, train_idx, test_idx, parquet_path: str, indices_path: str):
+    """
+    Write the cleaned data and split indices to temp files, then rename them into place,
+    the indices last. Readers require both files, so they never see a partial file
+    or an indices file without its data.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_paths = []
+    try:
+        for suffix in (".parquet.tmp", ".npz.tmp"):
+            fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=suffix)
+            os.close(fd)
+            tmp_paths.append(tmp)
+        tmp_parquet, tmp_indices = tmp_paths
+
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_parquet,
+                       compression="zstd")
+        with open(tmp_indices, "wb") as f:
+            np.savez(f, train=train_idx, test=test_idx)
+
+        os.replace(tmp_parquet, parquet_path)
+        os.replace(tmp_indices, indices_path)
+    finally:
+        for tmp in tmp_paths:
+            if os.path.exists(tmp):
+                os.remove(tmp)
 
 
 def get_train_test_split(dataset_id: str, test_size: float = 0.2, max_samples: int = 50000):
     """
     Load data, optionally subsample for speed, and return stratified train/test split.
-    Returns (X_train, X_test, y_train, y_test)
+    The cleaned data and split indices are cached under CACHE_DIR, so repeat calls
+    skip reading and cleaning the CSVs.
+    Returns (X_train, X_test, y_train, y_test) as NumPy arrays (X_* hold str objects).
     """
-    df = load_dataset(dataset_id)
+    cache_path = _split_cache_path(dataset_id, test_size, max_samples)
+    parquet_path = cache_path + ".parquet"
+    indices_path = cache_path + ".indices.npz"
 
-    # Subsample if dataset is too large (for faster training)
-    if len(df) > max_samples:
-        df = df.sample(n=max_samples, random_state=42, replace=False).reset_index(drop=True)
+    if os.path.exists(parquet_path) and os.path.exists(indices_path):
+        df = pd.read_parquet(parquet_path, dtype_backend="pyarrow")
+        with np.load(indices_path) as indices:
+            train_idx, test_idx = indices["train"], indices["test"]
+    else:
+        df = _load_raw(dataset_id)
 
-    X = df["text"].values
-    y = df["label"].values
+        # Subsample before cleaning so discarded rows never hit the regex pipeline
+        if len(df) > max_samples:
+            df = df.sample(n=max_samples, random_state=42, replace=False).reset_index(drop=True)
+        df = _clean(df)
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=test_size, random_state=42, stratify=y
-    )
-    return X_train, X_test, y_train, y_test
+        train_idx, test_idx = train_test_split(
+            np.arange(len(df)), test_size=test_size, random_state=42,
+            stratify=df["label"].to_numpy(),
+        )
+
+        _write_split_cache(df, train_idx, test_idx, parquet_path, indices_path)
+
+    # The vectorizers iterate over the texts in Python; an object ndarray yields the str
+    # objects directly, where an Arrow array would build a scalar and call .as_py() per row.
+    X = df["text"].to_numpy(dtype=object)
+    y = df["label"].to_numpy()
+    return X[train_idx], X[test_idx], y[train_idx], y[test_idx]
 
 
 def get_dataset_stats(dataset_id: str) -> dict:
@@ -3,12 +3,16 @@ Email alert service for cyberbullying detection.
 Provides SMTP configuration management and alert email sending.
 """
 
+import queue
 import smtplib
+import logging
+from string import Template
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from pydantic import BaseModel
 from typing import Optional
 
+logger = logging.getLogger(__name__)
 
 class EmailConfig(BaseModel):
     smtp_host: str = ""
@@ -22,6 +26,39 @@ class EmailConfig(BaseModel):
 # In-memory config store
 _email_config: Optional[EmailConfig] = None
 
+# Pool of keep-alive SMTP connections shared across alerts. Each slot holds either
+# None (not connected yet) or (config_key, connection); taking a slot also bounds
+# the number of concurrent sends to SMTP_POOL_SIZE.
+SMTP_POOL_SIZE = 4
+_smtp_pool: "queue.Queue[Optional[tuple]]" = queue.Queue()
+for _ in range(SMTP_POOL_SIZE):
+    _smtp_pool.put(None)
+
+_ALERT_TEMPLATE = Template("""
+    <html>
+    <body style="font-family: 'Segoe UI', Arial, sans-serif; background: #0f172a; color: #f1f5f9; padding: 32px;">
+      <div style="max-width: 600px; margin: 0 auto; background: #1e293b; border-radius: 16px; padding: 32px; border: 1px solid rgba(244,63,94,0.3);">
+        <h1 style="color: #f43f5e; text-align: center; font-size: 24px;">🚨 Cyberbullying Detected</h1>
+        <hr style="border: none; border-top: 1px solid rgba(255,255,255,0.1); margin: 20px 0;">
+        <table style="width: 100%; font-size: 14px; color: #94a3b8;">
+          <tr><td style="padding: 8px 0; font-weight: 600;">Classification:</td><td style="color: #f43f5e; font-weight: 700;">$label</td></tr>
+          <tr><td style="padding: 8px 0; font-weight: 600;">Confidence:</td><td>$confidence_pct</td></tr>
+          <tr><td style="padding: 8px 0; font-weight: 600;">Model Used:</td><td>$model_name</td></tr>
+        </table>
+        <div style="margin-top: 20px;">
+          <div style="font-size: 12px; color: #64748b; text-transform: uppercase; margin-bottom: 8px;">Flagged Text:</div>
+          <div style="background: rgba(244,63,94,0.1); border: 1px solid rgba(244,63,94,0.2); border-radius: 8px; padding: 16px; font-size: 14px; line-height: 1.6;">
+            $text
+          </div>
+        </div>
+        <p style="font-size: 12px; color: #64748b; text-align: center; margin-top: 24px;">
+          Sent by CyberShield ML Analysis System
+        </p>
+      </div>
+    </body>
+    </html>
+    """)
+
 
 def save_config(config: EmailConfig):
     """Save email configuration in memory."""
@@ -44,63 +81,113 @@ def get_config() -> Optional[dict]:
     }
 
 
-def send_alert_email(text: str, label: str, confidence: float, model_name: str) -> dict:
-    """Send a cyberbullying alert email using the stored SMTP config."""
+def _connect(config: EmailConfig) -> smtplib.SMTP:
+    """Open and authenticate a new SMTP connection."""
+    if config.use_tls:
+        server = smtplib.SMTP(config.smtp_host, config.smtp_port)
+        server.starttls()
+    else:
+        server = smtplib.SMTP_SSL(config.smtp_host, config.smtp_port)
+    server.login(config.sender_email, config.sender_password)
+    return server
+
+
+def _is_alive(server: smtplib.SMTP) -> bool:
+    try:
+        return server.noop()[0] == 250
+    except (smtplib.SMTPException, OSError):
+        return False
+
+
+def _close(server: Optional[smtplib.SMTP]):
+    if server is None:
+        return
+    try:
+        server.quit()
+    except (smtplib.SMTPException, OSError):
+        server.close()
+
+
+def _config_key(config: EmailConfig) -> int:
+    return hash((config.smtp_host, config.smtp_port, config.sender_email,
+                 config.sender_password, config.use_tls))
+
+
+def _checkout(config: EmailConfig) -> tuple:
+    """
+    Take a pool slot and return (config_key, connection), reusing the slot's connection
+    if it was opened with the current config and still answers NOOP.
+    The slot must be given back with _checkin.
+    """
+    key = _config_key(config)
+    slot = _smtp_pool.get()
+    if slot is not None:
+        slot_key, server = slot
+        if slot_key == key and _is_alive(server):
+            return key, server
+        _close(server)
+    try:
+        return key, _connect(config)
+    except Exception:
+        _smtp_pool.put(None)
+        raise
+
+
+def _checkin(key: int, server: Optional[smtplib.SMTP]):
+    _smtp_pool.put((key, server) if server is not None else None)
+
+
+def require_config() -> EmailConfig:
+    """Return the stored SMTP config, raising ValueError if it is missing or incomplete."""
     if _email_config is None:
         raise ValueError("Email is not configured. Please set up SMTP settings first.")
 
     if not _email_config.smtp_host or not _email_config.sender_email:
         raise ValueError("Incomplete email configuration. Please fill in all SMTP fields.")
 
-    # Build email
+    return _email_config
+
+
+def _build_message(config: EmailConfig, text: str, label: str, confidence: float,
+                   model_name: str) -> MIMEMultipart:
     msg = MIMEMultipart("alternative")
     msg["Subject"] = "🚨 Cyberbullying Alert — CyberShield Detection"
-    msg["From"] = _email_config.sender_email
-    msg["To"] = _email_config.recipient_email
+    msg["From"] = config.sender_email
+    msg["To"] = config.recipient_email
 
     confidence_pct = f"{confidence * 100:.1f}%" if confidence else "N/A"
 
-    html_body = f"""
-    <html>
-    <body style="font-family: 'Segoe UI', Arial, sans-serif; background: #0f172a; color: #f1f5f9; padding: 32px;">
-      <div style="max-width: 600px; margin: 0 auto; background: #1e293b; border-radius: 16px; padding: 32px; border: 1px solid rgba(244,63,94,0.3);">
-        <h1 style="color: #f43f5e; text-align: center; font-size: 24px;">🚨 Cyberbullying Detected</h1>
-        <hr style="border: none; border-top: 1px solid rgba(255,255,255,0.1); margin: 20px 0;">
-        <table style="width: 100%; font-size: 14px; color: #94a3b8;">
-          <tr><td style="padding: 8px 0; font-weight: 600;">Classification:</td><td style="color: #f43f5e; font-weight: 700;">{label}</td></tr>
-          <tr><td style="padding: 8px 0; font-weight: 600;">Confidence:</td><td>{confidence_pct}</td></tr>
-          <tr><td style="padding: 8px 0; font-weight: 600;">Model Used:</td><td>{model_name}</td></tr>
-        </table>
-        <div style="margin-top: 20px;">
-          <div style="font-size: 12px; color: #64748b; text-transform: uppercase; margin-bottom: 8px;">Flagged Text:</div>
-          <div style="background: rgba(244,63,94,0.1); border: 1px solid rgba(244,63,94,0.2); border-radius: 8px; padding: 16px; font-size: 14px; line-height: 1.6;">
-            {text}
-          </div>
-        </div>
-        <p style="font-size: 12px; color: #64748b; text-align: center; margin-top: 24px;">
-          Sent by CyberShield ML Analysis System
-        </p>
-      </div>
-    </body>
-    </html>
-    """
+    html_body = _ALERT_TEMPLATE.substitute(
+        label=label, confidence_pct=confidence_pct, model_name=model_name, text=text
+    )
 
     msg.attach(MIMEText(html_body, "html"))
+    return msg
+
+
+def send_alert_email(text: str, label: str, confidence: float, model_name: str) -> dict:
+    """Send a cyberbullying alert email using the stored SMTP config."""
+    config = require_config()
+    msg = _build_message(config, text, label, confidence, model_name)
 
     try:
-        if _email_config.use_tls:
-            server = smtplib.SMTP(_email_config.smtp_host, _email_config.smtp_port)
-            server.starttls()
-        else:
-            server = smtplib.SMTP_SSL(_email_config.smtp_host, _email_config.smtp_port)
-
-        server.login(_email_config.sender_email, _email_config.sender_password)
-        server.sendmail(
-            _email_config.sender_email,
-            _email_config.recipient_email,
-            msg.as_string(),
-        )
-        server.quit()
-        return {"success": True, "message": f"Alert email sent to {_email_config.recipient_email}"}
+        key, server = _checkout(config)
+        try:
+            try:
+                server.sendmail(config.sender_email, config.recipient_email, msg.as_string())
+            except smtplib.SMTPServerDisconnected:
+                # The server dropped us between the NOOP check and the send; retry once
+                _close(server)
+                server = None
+                server = _connect(config)
+                server.sendmail(config.sender_email, config.recipient_email, msg.as_string())
+        except Exception:
+            _close(server)
+            server = None
+            raise
+        finally:
+            _checkin(key, server)
+        return {"success": True, "message": f"Alert email sent to {config.recipient_email}"}
     except Exception as e:
+        logger.warning("Failed to send alert email: %s", e)
         return {"success": False, "message": f"Failed to send email: {str(e)}"}
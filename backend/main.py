@@ -2,14 +2,27 @@
 Main FastAPI application entry point.
 """
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routes import router
+from fastapi.middleware.gzip import GZipMiddleware
+from routes import router, warm_caches
+
+
+# Warm caches (saved models, default split) before serving the first request
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warm_caches()
+    yield
+
 
 app = FastAPI(
     title="Cyberbullying Detection API",
     description="Comparative ML analysis for cyberbullying detection",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 # CORS — allow frontend dev server
@@ -21,6 +34,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress larger JSON payloads (training results, comparisons)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Mount routes
 app.include_router(router)
 
@@ -16,33 +16,35 @@ from typing import Tuple, Dict, Any, List
 
 def _impute_missing(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, int]]:
     """Impute missing values: mean for numeric, mode for categorical."""
-    stats: Dict[str, int] = {}
-    for col in df.columns:
-        n_missing = int(df[col].isna().sum())
-        if n_missing == 0:
-            continue
-        if pd.api.types.is_numeric_dtype(df[col]):
-            df[col].fillna(df[col].mean(), inplace=True)
-        else:
-            mode_val = df[col].mode()
-            df[col].fillna(mode_val[0] if len(mode_val) > 0 else "UNKNOWN", inplace=True)
-        stats[col] = n_missing
+    missing_counts = df.isna().sum()
+    stats: Dict[str, int] = missing_counts[missing_counts > 0].astype(int).to_dict()
+    if not stats:
+        return df, stats
+
+    means = df.select_dtypes(include=[np.number]).mean(numeric_only=True)
+    cat_df = df.select_dtypes(exclude=[np.number])
+    modes = cat_df.mode(dropna=True)
+    if len(modes):
+        modes = modes.iloc[0]
+    else:
+        modes = pd.Series(np.nan, index=cat_df.columns, dtype=object)
+
+    fill = {**means.to_dict(), **modes.fillna("UNKNOWN").to_dict()}
+    df = df.fillna({col: fill[col] for col in stats})
     return df, stats
 
 
 def _remove_outliers(df: pd.DataFrame, factor: float = 1.5) -> Tuple[pd.DataFrame, int]:
     """Remove outliers using IQR method on numeric columns."""
-    numeric_cols = df.select_dtypes(include=[np.number]).columns
-    mask = pd.Series(True, index=df.index)
-    for col in numeric_cols:
-        q1 = df[col].quantile(0.25)
-        q3 = df[col].quantile(0.75)
-        iqr = q3 - q1
-        lower = q1 - factor * iqr
-        upper = q3 + factor * iqr
-        mask &= df[col].between(lower, upper)
+    num_df = df.select_dtypes(include=[np.number])
+    q = num_df.quantile([0.25, 0.75])
+    iqr = q.loc[0.75] - q.loc[0.25]
+    lower = (q.loc[0.25] - factor * iqr).to_numpy()
+    upper = (q.loc[0.75] + factor * iqr).to_numpy()
+    vals = num_df.to_numpy()
+    mask = ((vals >= lower) & (vals <= upper)).all(axis=1)
     removed = int((~mask).sum())
-    return df[mask].reset_index(drop=True), removed
+    return df.iloc[mask].reset_index(drop=True), removed
 
 
 def clean_data(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, Any]]:
@@ -99,8 +101,12 @@ def engineer_features(
     cat_cols = X.select_dtypes(include=["object", "category"]).columns.tolist()
     encoders: List[LabelEncoder] = []
     for col in cat_cols:
+        # Category codes match LabelEncoder's sorted-class encoding; the encoder is
+        # kept (with classes_ set directly) for downstream inverse transforms.
+        cat = X[col].astype(str).astype("category")
+        X[col] = cat.cat.codes.astype(np.int32)
         le = LabelEncoder()
-        X[col] = le.fit_transform(X[col].astype(str))
+        le.classes_ = np.asarray(cat.cat.categories)
         encoders.append(le)
     stats["columns_encoded"] = cat_cols
 
@@ -2,13 +2,16 @@
 Model Training Pipeline
 ========================
 Supports: SVM, MultinomialNB, Logistic Regression, XGBoost, lightweight FFN.
-Text features: TF-IDF, Word Embeddings (simple averaging), Ensemble of both.
+Text features: TF-IDF, Word Embeddings (LSA over the shared TF-IDF), Ensemble of both.
 """
 
 from __future__ import annotations
+import os
 import time
+from collections import OrderedDict
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 from typing import Any, Callable, Dict, List, Optional
 
 from sklearn.svm import SVC
@@ -16,20 +19,33 @@ from sklearn.naive_bayes import MultinomialNB
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import accuracy_score, f1_score
 from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.decomposition import TruncatedSVD
+from sklearn.pipeline import make_pipeline
 from sklearn.preprocessing import MinMaxScaler
 import xgboost as xgb
+from joblib import Parallel, delayed
 
 import torch
 import torch.nn as nn
-from torch.utils.data import DataLoader, TensorDataset
 
 # ── Lightweight Feed-Forward Network ─────────────────────────────────────────
 
 class _FFN(nn.Module):
-    def __init__(self, input_dim: int, num_classes: int):
+    """
+    With sparse_input=True the first layer is an EmbeddingBag that sums the weight
+    rows of each sample's nonzero features (scaled by their values) — the same
+    math as a Linear layer over the sparse row, without touching the zeros.
+    """
+
+    def __init__(self, input_dim: int, num_classes: int, sparse_input: bool = False):
         super().__init__()
+        self.sparse_input = sparse_input
+        if sparse_input:
+            self.embed = nn.EmbeddingBag(input_dim, 128, mode="sum", sparse=True)
+            self.embed_bias = nn.Parameter(torch.zeros(128))
+        else:
+            self.embed = nn.Linear(input_dim, 128)
         self.net = nn.Sequential(
-            nn.Linear(input_dim, 128),
             nn.ReLU(),
             nn.Dropout(0.3),
             nn.Linear(128, 64),
@@ -38,37 +54,99 @@ class _FFN(nn.Module):
             nn.Linear(64, num_classes),
         )
 
-    def forward(self, x):
-        return self.net(x)
+    def forward(self, x, offsets=None, weights=None):
+        if self.sparse_input:
+            h = self.embed(x, offsets, per_sample_weights=weights) + self.embed_bias
+        else:
+            h = self.embed(x)
+        return self.net(h)
+
+
+def _to_dense_tensor(X, device) -> torch.Tensor:
+    """Convert a dense feature block to a float32 tensor on device."""
+    t = torch.as_tensor(X, dtype=torch.float32)
+    if device.type == "cuda":
+        t = t.pin_memory()
+    return t.to(device, non_blocking=True)
+
+
+def _to_bag(X: sp.csr_matrix, device):
+    """Convert CSR rows to EmbeddingBag (indices, offsets, per_sample_weights) tensors."""
+    indices = torch.as_tensor(X.indices, dtype=torch.long).to(device, non_blocking=True)
+    offsets = torch.as_tensor(X.indptr[:-1], dtype=torch.long).to(device, non_blocking=True)
+    weights = _to_dense_tensor(X.data, device)
+    return indices, offsets, weights
+
+
+def _compile_ffn(model: nn.Module, device) -> nn.Module:
+    """
+    CUDA: torch.compile with CUDA graphs to cut launch overhead. CPU: eager, since
+    TorchScript does not reliably honour CPU autocast (bfloat16) regions.
+    Sparse-input models stay eager: sparse gradients are not capturable.
+    """
+    if device.type == "cuda" and not model.sparse_input:
+        return torch.compile(model, mode="reduce-overhead", fullgraph=True)
+    return model
 
 
-def _train_ffn(X_train: np.ndarray, y_train: np.ndarray, X_test: np.ndarray, y_test: np.ndarray,
-               num_classes: int, epochs: int = 20, lr: float = 1e-3):
+def _train_ffn(X_train, y_train: np.ndarray, X_test, y_test: np.ndarray,
+               num_classes: int, epochs: int = 20, lr: float = 1e-3, batch_size: int = 256):
+    """
+    Train the FFN with bfloat16 mixed precision. Dense features are moved to the
+    device once and batched by indexing with a device-side permutation; sparse
+    features stay on the host as CSR and are fed per batch to an EmbeddingBag.
+    """
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model = _FFN(X_train.shape[1], num_classes).to(device)
-    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    if device.type == "cpu":
+        torch.set_num_threads(os.cpu_count() or 1)
+
+    sparse_input = sp.issparse(X_train)
+    model = _FFN(X_train.shape[1], num_classes, sparse_input=sparse_input).to(device)
+    if sparse_input:
+        X_train = X_train.tocsr()
+        X_test = X_test.tocsr()
+        embed_params = list(model.embed.parameters())
+        head_params = [p for p in model.parameters() if all(p is not e for e in embed_params)]
+        optimizers = [torch.optim.SparseAdam(embed_params, lr=lr),
+                      torch.optim.Adam(head_params, lr=lr)]
+    else:
+        Xt = _to_dense_tensor(X_train, device)
+        optimizers = [torch.optim.Adam(model.parameters(), lr=lr)]
     criterion = nn.CrossEntropyLoss()
+    step_model = _compile_ffn(model, device)
 
-    Xt = torch.tensor(X_train, dtype=torch.float32).to(device)
-    yt = torch.tensor(y_train, dtype=torch.long).to(device)
-    ds = TensorDataset(Xt, yt)
-    loader = DataLoader(ds, batch_size=256, shuffle=True)
+    def batch_inputs(X, rows):
+        if sparse_input:
+            return _to_bag(X[rows], device)
+        return (_to_dense_tensor(X[rows], device),)
+
+    yt = torch.as_tensor(y_train, dtype=torch.long).to(device, non_blocking=True)
+    n = X_train.shape[0]
 
     t0 = time.perf_counter()
-    model.train()
+    step_model.train()
     for _ in range(epochs):
-        for xb, yb in loader:
-            optimizer.zero_grad()
-            loss = criterion(model(xb), yb)
+        perm = torch.randperm(n, device=device)
+        for i in range(0, n, batch_size):
+            idx = perm[i:i + batch_size]
+            inputs = batch_inputs(X_train, idx.cpu().numpy()) if sparse_input else (Xt[idx],)
+            for opt in optimizers:
+                opt.zero_grad()
+            # bfloat16 activations; weights and optimizer state stay in float32
+            with torch.autocast(device_type=device.type, dtype=torch.bfloat16):
+                loss = criterion(step_model(*inputs), yt[idx])
             loss.backward()
-            optimizer.step()
+            for opt in optimizers:
+                opt.step()
     train_time = time.perf_counter() - t0
 
-    model.eval()
-    with torch.no_grad():
-        Xte = torch.tensor(X_test, dtype=torch.float32).to(device)
+    step_model.eval()
+    with torch.inference_mode(), torch.autocast(device_type=device.type, dtype=torch.bfloat16):
         t1 = time.perf_counter()
-        preds = model(Xte).argmax(dim=1).cpu().numpy()
+        preds = np.concatenate([
+            step_model(*batch_inputs(X_test, slice(i, i + batch_size))).argmax(dim=1).cpu().numpy()
+            for i in range(0, X_test.shape[0], batch_size)
+        ])
         inference_time = time.perf_counter() - t1
 
     return preds, train_time, inference_time
@@ -76,26 +154,54 @@ def _train_ffn(X_train: np.ndarray, y_train: np.ndarray, X_test: np.ndarray, y_t
 
 # ── Text Feature Extraction ──────────────────────────────────────────────────
 
-def _extract_tfidf(X_train: pd.DataFrame, X_test: pd.DataFrame, text_col: str):
-    vec = TfidfVectorizer(max_features=5000)
-    Xtr = vec.fit_transform(X_train[text_col].astype(str)).toarray()
-    Xte = vec.transform(X_test[text_col].astype(str)).toarray()
-    return Xtr, Xte, vec
+# Fitted TF-IDF results keyed by (id(X_train), id(X_test), text_col, max_features).
+# Entries hold references to the frames themselves, so the ids stay valid while cached.
+_TFIDF_CACHE_SIZE = 4
+_tfidf_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+
+def _fit_tfidf(X_train: pd.DataFrame, X_test: pd.DataFrame, text_col: str, max_features: int = 5000):
+    """Fit TF-IDF on a train/test split, reusing the result if this split was already seen."""
+    key = (id(X_train), id(X_test), text_col, max_features)
+    hit = _tfidf_cache.get(key)
+    if hit is not None and hit[0] is X_train and hit[1] is X_test:
+        _tfidf_cache.move_to_end(key)
+        return hit[2]
 
+    vec = TfidfVectorizer(max_features=max_features)
+    Xtr = vec.fit_transform(X_train[text_col].astype(str))
+    Xte = vec.transform(X_test[text_col].astype(str))
 
-def _extract_embeddings(X_train: pd.DataFrame, X_test: pd.DataFrame, text_col: str):
-    """Simple TF-IDF based embeddings as a lightweight alternative to loading GloVe."""
-    vec = TfidfVectorizer(max_features=3000)
-    Xtr = vec.fit_transform(X_train[text_col].astype(str)).toarray()
-    Xte = vec.transform(X_test[text_col].astype(str)).toarray()
+    _tfidf_cache[key] = (X_train, X_test, (Xtr, Xte, vec))
+    if len(_tfidf_cache) > _TFIDF_CACHE_SIZE:
+        _tfidf_cache.popitem(last=False)
     return Xtr, Xte, vec
 
 
+def _extract_tfidf(X_train: pd.DataFrame, X_test: pd.DataFrame, text_col: str):
+    return _fit_tfidf(X_train, X_test, text_col)
+
+
+def _extract_embeddings(X_train: pd.DataFrame, X_test: pd.DataFrame, text_col: str,
+                        n_components: int = 300):
+    """
+    Dense LSA embeddings (TruncatedSVD over the shared TF-IDF matrix) as a
+    lightweight alternative to loading GloVe.
+    """
+    Xtr_tfidf, Xte_tfidf, vec = _fit_tfidf(X_train, X_test, text_col)
+    svd = TruncatedSVD(n_components=min(n_components, Xtr_tfidf.shape[1] - 1), random_state=42)
+    Xtr = svd.fit_transform(Xtr_tfidf)
+    Xte = svd.transform(Xte_tfidf)
+    return Xtr, Xte, make_pipeline(vec, svd)
+
+
 def _extract_ensemble(X_train: pd.DataFrame, X_test: pd.DataFrame, text_col: str):
     """Concatenate TF-IDF and embedding features."""
     Xtr1, Xte1, _ = _extract_tfidf(X_train, X_test, text_col)
     Xtr2, Xte2, _ = _extract_embeddings(X_train, X_test, text_col)
-    return np.hstack([Xtr1, Xtr2]), np.hstack([Xte1, Xte2]), None
+    Xtr = sp.hstack([Xtr1, sp.csr_matrix(Xtr2)], format="csr")
+    Xte = sp.hstack([Xte1, sp.csr_matrix(Xte2)], format="csr")
+    return Xtr, Xte, None
 
 
 TEXT_EXTRACTORS = {
@@ -119,6 +225,32 @@ def _get_model(name: str):
     return models.get(name)
 
 
+def _make_nonnegative(X_train, X_test):
+    """
+    Min-max scale the feature columns that have negative values in X_train.
+    Dense input is scaled as a whole. For sparse input only the negative columns
+    (e.g. the LSA block of the ensemble) are densified and scaled; non-negative
+    sparse columns such as TF-IDF are passed through as they are.
+    """
+    if not sp.issparse(X_train):
+        scaler = MinMaxScaler()
+        return scaler.fit_transform(X_train), scaler.transform(X_test)
+
+    X_train, X_test = X_train.tocsc(), X_test.tocsc()
+    neg = np.flatnonzero(X_train.min(axis=0).toarray().ravel() < 0)
+    if neg.size == 0:
+        return X_train.tocsr(), X_test.tocsr()
+
+    keep = np.setdiff1d(np.arange(X_train.shape[1]), neg)
+    scaler = MinMaxScaler().fit(X_train[:, neg].toarray())
+
+    def rebuild(X):
+        scaled = sp.csr_matrix(scaler.transform(X[:, neg].toarray()))
+        return sp.hstack([X[:, keep], scaled], format="csr")
+
+    return rebuild(X_train), rebuild(X_test)
+
+
 # ── Single-model training ────────────────────────────────────────────────────
 
 def train_model(
@@ -142,9 +274,7 @@ def train_model(
 
         # MultinomialNB requires non-negative features
         if name == "naive_bayes":
-            scaler = MinMaxScaler()
-            X_train = scaler.fit_transform(X_train)
-            X_test = scaler.transform(X_test)
+            X_train, X_test = _make_nonnegative(X_train, X_test)
 
         t0 = time.perf_counter()
         model.fit(X_train, y_train)
@@ -166,6 +296,11 @@ def train_model(
     }
 
 
+def _train_named(name: str, *args) -> tuple:
+    """train_model wrapper for parallel workers, tagging the result with its model name."""
+    return name, train_model(name, *args)
+
+
 # ── Full pipeline orchestrator ────────────────────────────────────────────────
 
 def detect_text_column(X: pd.DataFrame) -> Optional[str]:
@@ -188,10 +323,9 @@ def run_pipeline(
     progress_callback: Optional[Callable[[dict], None]] = None,
 ) -> List[Dict[str, Any]]:
     """
-    Orchestrate training across selected models.
+    Orchestrate training across selected models, training the CPU models in parallel.
     Calls progress_callback({"step": i, "total": n, "model": name, "status": ...})
     """
-    results: List[Dict[str, Any]] = []
     total = len(model_names)
 
     # Text feature extraction if applicable
@@ -210,15 +344,37 @@ def run_pipeline(
     y_train_arr = np.array(y_train)
     y_test_arr = np.array(y_test)
 
-    for i, name in enumerate(model_names):
-        if progress_callback:
-            progress_callback({"step": i, "total": total, "model": name,
-                               "status": f"Training {name}..."})
-        metrics = train_model(name, X_train_arr, y_train_arr, X_test_arr, y_test_arr)
-        results.append(metrics)
+    # CPU models are independent fits on the same matrices, so they run in parallel
+    # worker processes; the FFN stays in this process where it owns the GPU.
+    cpu_names = [name for name in model_names if name != "ffn"]
+    by_name: Dict[str, Dict[str, Any]] = {}
+    done = 0
 
+    def _finished(name: str, metrics: Dict[str, Any]):
+        nonlocal done
+        done += 1
+        by_name[name] = metrics
         if progress_callback:
-            progress_callback({"step": i + 1, "total": total, "model": name,
+            progress_callback({"step": done, "total": total, "model": name,
                                "status": f"Finished {name}", "metrics": metrics})
 
-    return results
+    if cpu_names:
+        if progress_callback:
+            for name in cpu_names:
+                progress_callback({"step": done, "total": total, "model": name,
+                                   "status": f"Training {name}..."})
+        jobs = Parallel(n_jobs=min(len(cpu_names), os.cpu_count() or 1), backend="loky",
+                        return_as="generator_unordered")(
+            delayed(_train_named)(name, X_train_arr, y_train_arr, X_test_arr, y_test_arr)
+            for name in cpu_names
+        )
+        for name, metrics in jobs:
+            _finished(name, metrics)
+
+    if "ffn" in model_names:
+        if progress_callback:
+            progress_callback({"step": done, "total": total, "model": "ffn",
+                               "status": "Training ffn..."})
+        _finished("ffn", train_model("ffn", X_train_arr, y_train_arr, X_test_arr, y_test_arr))
+
+    return [by_name[name] for name in model_names]
@@ -4,13 +4,19 @@ ML Pipeline module — trains and evaluates 6 model configurations:
   Word Embeddings (SVD dense vectors) + {GaussianNB, SVM, Logistic Regression}
 
 Uses only scikit-learn (no Gensim / C compiler needed).
-Word Embeddings are approximated via CountVectorizer + TruncatedSVD to create
+Word Embeddings are approximated via TruncatedSVD over the TF-IDF matrix to create
 dense semantic vectors from bag-of-words, similar to LSA/LSI embeddings.
 """
 
+import os
+import glob
 import time
+import logging
+import hashlib
+import tempfile
+import joblib
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
+from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.decomposition import TruncatedSVD
 from sklearn.preprocessing import Normalizer
 from sklearn.pipeline import make_pipeline
@@ -19,12 +25,33 @@ from sklearn.svm import LinearSVC
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
 from sklearn.calibration import CalibratedClassifierCV
+from sklearn.model_selection import train_test_split
+
+try:
+    from sklearn.frozen import FrozenEstimator
+except ImportError:  # scikit-learn < 1.6
+    FrozenEstimator = None
+
+logger = logging.getLogger(__name__)
 
 # ─── Global caches ─────────────────────────────────────────────
 _tfidf_vectorizer = None
-_embedding_pipeline = None   # CountVectorizer + TruncatedSVD
+_embedding_pipeline = None   # TfidfVectorizer + TruncatedSVD + Normalizer
 _trained_models = {}          # key -> (model, feature_type, vectorizer)
 
+# Extracted features, reused across classifiers trained on the same split.
+# In memory: (id(X_train), id(X_test), feature_type) -> (X_train, X_test, (X_train_vec, X_test_vec, transformer, digest));
+# entries keep the split arrays alive so their ids cannot be recycled while cached.
+# On disk: fitted transformers + matrices under CACHE_DIR, keyed by a hash of the split contents.
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache")
+FEATURE_CACHE_VERSION = 2
+MODELS_DIR = os.path.join(CACHE_DIR, "models")
+_FEATURE_CACHE_SIZE = 4
+FEATURE_CACHE_MAX_FILES = 8   # newest features-*.joblib files kept on disk
+_feature_cache = {}
+_feature_session = None
+_feature_keys = {}            # feature_type -> split digest of the most recently extracted features
+
 
 # ─── Feature Extraction ────────────────────────────────────────
 
@@ -35,26 +62,160 @@ def build_tfidf(X_train, X_test, max_features=15000):
         max_features=max_features, ngram_range=(1, 2), sublinear_tf=True
     )
     X_train_vec = _tfidf_vectorizer.fit_transform(X_train)
+    # stop_words_ holds every n-gram pruned by max_features and is only kept for
+    # introspection; dropping it keeps the pickled vectorizer small
+    _tfidf_vectorizer.stop_words_ = None
     X_test_vec = _tfidf_vectorizer.transform(X_test)
     return X_train_vec, X_test_vec
 
 
-def build_word_embeddings(X_train, X_test, n_components=200, max_features=20000):
+def build_word_embeddings(X_train, X_test, n_components=200, tfidf=None):
     """
-    Create dense word-embedding-like vectors using LSA (TruncatedSVD on count matrix).
-    This produces semantic dense vectors similar to Word2Vec but using only sklearn.
+    Create dense word-embedding-like vectors using LSA (randomized TruncatedSVD on the
+    TF-IDF matrix). This produces semantic dense vectors similar to Word2Vec but using only sklearn.
+    Pass tfidf=(fitted_vectorizer, X_train_tfidf, X_test_tfidf) to reuse an existing
+    TF-IDF fit instead of tokenizing the text again.
     """
     global _embedding_pipeline
-    count_vec = CountVectorizer(max_features=max_features, ngram_range=(1, 2))
-    svd = TruncatedSVD(n_components=n_components, random_state=42)
+    if tfidf is None:
+        X_train_tfidf, X_test_tfidf = build_tfidf(X_train, X_test)
+        tfidf = (_tfidf_vectorizer, X_train_tfidf, X_test_tfidf)
+    tfidf_vec, X_train_tfidf, X_test_tfidf = tfidf
+
+    svd = TruncatedSVD(n_components=n_components, algorithm="randomized", n_iter=5, random_state=42)
     normalizer = Normalizer(copy=False)
-    _embedding_pipeline = make_pipeline(count_vec, svd, normalizer)
+    _embedding_pipeline = make_pipeline(tfidf_vec, svd, normalizer)
+
+    X_train_vec = normalizer.fit_transform(svd.fit_transform(X_train_tfidf))
+    X_test_vec = normalizer.transform(svd.transform(X_test_tfidf))
+    return X_train_vec, X_test_vec
+
+
+def _dump_atomic(obj, path: str):
+    """
+    joblib.dump to a temp file in the target directory, then rename it into place,
+    so concurrent readers (training runs in several processes) never see a partial file.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    try:
+        joblib.dump(obj, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass   # removed by another process
+
+
+def _evict_feature_files():
+    """Delete all but the FEATURE_CACHE_MAX_FILES most recently used feature cache files."""
+    entries = []
+    for path in glob.glob(os.path.join(CACHE_DIR, "features-*.joblib")):
+        try:
+            entries.append((os.path.getmtime(path), path))
+        except FileNotFoundError:
+            pass   # removed by another process
+    entries.sort(reverse=True)
+    for _, path in entries[FEATURE_CACHE_MAX_FILES:]:
+        _remove_file(path)
+
+
+def _load_feature_file(path: str):
+    """
+    Load a features-*.joblib file and mark it recently used. Returns None on a miss;
+    a corrupt or incompatible file counts as a miss and is deleted so it gets rebuilt.
+    """
+    try:
+        features = joblib.load(path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("Discarding unreadable feature cache %s: %s", path, e)
+        _remove_file(path)
+        return None
+    try:
+        os.utime(path)   # mark as recently used for _evict_feature_files
+    except FileNotFoundError:
+        pass   # evicted by another process after we loaded it
+    return features
+
+
+def _split_digest(X_train, X_test, feature_type: str) -> str:
+    """Content hash of a train/test split, used to key on-disk feature caches."""
+    h = hashlib.sha1(f"{feature_type}|{FEATURE_CACHE_VERSION}".encode())
+    for part in (X_train, X_test):
+        h.update(b"\x01")
+        h.update("\x00".join(map(str, part)).encode())
+    return h.hexdigest()
+
+
+def extract_features(feature_type: str, X_train, X_test, session_id=None):
+    """
+    Return (X_train_vec, X_test_vec) for a feature type, fitting the vectorizer only
+    if this split has not been seen in the current session or on disk.
+    Passing a new session_id drops the in-memory cache.
+    """
+    global _tfidf_vectorizer, _embedding_pipeline, _feature_session
+
+    if session_id != _feature_session:
+        _feature_cache.clear()
+        _feature_session = session_id
+
+    key = (id(X_train), id(X_test), feature_type)
+    hit = _feature_cache.get(key)
+    if hit is not None and hit[0] is X_train and hit[1] is X_test:
+        X_train_vec, X_test_vec, transformer, digest = hit[2]
+    else:
+        digest = _split_digest(X_train, X_test, feature_type)
+        path = os.path.join(CACHE_DIR, f"features-{digest}.joblib")
+        features = _load_feature_file(path)
+        if features is not None:
+            X_train_vec, X_test_vec, transformer = features
+        else:
+            if feature_type == "tfidf":
+                X_train_vec, X_test_vec = build_tfidf(X_train, X_test)
+                transformer = _tfidf_vectorizer
+            else:
+                # Embeddings project the (shared, cached) TF-IDF matrix of this split
+                tfidf_train, tfidf_test = extract_features("tfidf", X_train, X_test, session_id)
+                X_train_vec, X_test_vec = build_word_embeddings(
+                    X_train, X_test, tfidf=(_tfidf_vectorizer, tfidf_train, tfidf_test)
+                )
+                transformer = _embedding_pipeline
+            _dump_atomic((X_train_vec, X_test_vec, transformer), path)
+            _evict_feature_files()
+
+        _feature_cache[key] = (X_train, X_test, (X_train_vec, X_test_vec, transformer, digest))
+        if len(_feature_cache) > _FEATURE_CACHE_SIZE:
+            _feature_cache.pop(next(iter(_feature_cache)))
 
-    X_train_vec = _embedding_pipeline.fit_transform(X_train)
-    X_test_vec = _embedding_pipeline.transform(X_test)
+    if feature_type == "tfidf":
+        _tfidf_vectorizer = transformer
+    else:
+        _embedding_pipeline = transformer
+    _feature_keys[feature_type] = digest
     return X_train_vec, X_test_vec
 
 
+def prepare_features(X_train, X_test, feature_types) -> None:
+    """
+    Fit and disk-cache the features of a split ahead of training, so workers that
+    train models on it load them instead of each fitting their own.
+    """
+    # TF-IDF first: the embeddings are projected from the same fitted matrix
+    for feature_type in sorted(set(feature_types), key=lambda f: f != "tfidf"):
+        extract_features(feature_type, X_train, X_test)
+
+
 # ─── Model Configurations ──────────────────────────────────────
 
 MODEL_CONFIGS = {
@@ -97,28 +258,65 @@ MODEL_CONFIGS = {
 }
 
 
+# Share of the training set held out to calibrate SVM probabilities
+SVM_CALIBRATION_SIZE = 0.2
+
+
 def _create_classifier(classifier_type: str, feature_type: str):
-    """Instantiate a classifier."""
+    """Instantiate a classifier. SVMs are returned uncalibrated; see _fit_classifier."""
     if classifier_type == "naive_bayes":
         if feature_type == "tfidf":
             return MultinomialNB(alpha=1.0)
         else:
             return GaussianNB()
     elif classifier_type == "svm":
-        return CalibratedClassifierCV(
-            LinearSVC(max_iter=2000, random_state=42, C=1.0, dual="auto"), cv=3
-        )
+        return LinearSVC(max_iter=2000, random_state=42, C=1.0, dual="auto")
     elif classifier_type == "logistic_regression":
-        return LogisticRegression(max_iter=1000, random_state=42, C=1.0, solver="lbfgs")
+        return LogisticRegression(
+            max_iter=1000, random_state=42, C=1.0, solver="lbfgs", warm_start=True
+        )
     else:
         raise ValueError(f"Unknown classifier: {classifier_type}")
 
 
+def _fit_classifier(model_key: str, classifier_type: str, feature_type: str, feature_key: tuple,
+                    X_train_vec, y_train):
+    """
+    Fit a classifier for model_key.
+    Logistic regression warm-starts from the previously trained coefficients when they
+    were fit on the same features (equal feature_key). SVMs are fit once on most of the
+    training set and calibrated on a held-out slice, instead of refitting an SVM per
+    cross-validation fold.
+    """
+    clf = _create_classifier(classifier_type, feature_type)
+
+    if classifier_type == "svm":
+        # Calibrating on the rows the SVM was fit on would make its probabilities over-confident
+        X_fit, X_cal, y_fit, y_cal = train_test_split(
+            X_train_vec, y_train, test_size=SVM_CALIBRATION_SIZE, stratify=y_train, random_state=42
+        )
+        clf.fit(X_fit, y_fit)
+        if FrozenEstimator is not None:
+            clf = CalibratedClassifierCV(FrozenEstimator(clf))
+        else:
+            clf = CalibratedClassifierCV(clf, cv="prefit")
+        return clf.fit(X_cal, y_cal)
+    elif classifier_type == "logistic_regression":
+        previous = _trained_models.get(model_key, {})
+        # Column counts match across vocabularies, so only reuse weights from the same features
+        if previous.get("feature_key") == feature_key:
+            clf.coef_ = previous["model"].coef_.copy()
+            clf.intercept_ = previous["model"].intercept_.copy()
+
+    return clf.fit(X_train_vec, y_train)
+
+
 # ─── Training & Evaluation ─────────────────────────────────────
 
-def train_model(model_key: str, X_train, X_test, y_train, y_test) -> dict:
+def train_model(model_key: str, X_train, X_test, y_train, y_test, session_id=None) -> dict:
     """
     Train a single model configuration and return metrics.
+    Features are shared with other models trained on the same split (see extract_features).
     """
     config = MODEL_CONFIGS[model_key]
     feature_type = config["feature"]
@@ -126,16 +324,13 @@ def train_model(model_key: str, X_train, X_test, y_train, y_test) -> dict:
 
     # Feature extraction
     feat_start = time.time()
-    if feature_type == "tfidf":
-        X_train_vec, X_test_vec = build_tfidf(X_train, X_test)
-    else:
-        X_train_vec, X_test_vec = build_word_embeddings(X_train, X_test)
+    X_train_vec, X_test_vec = extract_features(feature_type, X_train, X_test, session_id)
     feat_time = time.time() - feat_start
 
     # Training
-    clf = _create_classifier(classifier_type, feature_type)
     train_start = time.time()
-    clf.fit(X_train_vec, y_train)
+    feature_key = (feature_type, _feature_keys[feature_type])
+    clf = _fit_classifier(model_key, classifier_type, feature_type, feature_key, X_train_vec, y_train)
     train_time = time.time() - train_start
 
     # Prediction
@@ -158,13 +353,16 @@ def train_model(model_key: str, X_train, X_test, y_train, y_test) -> dict:
 
     total_time = feat_time + train_time + pred_time
 
-    # Cache trained model
+    # Cache trained model (and save it so restarts can preload it)
     _trained_models[model_key] = {
         "model": clf,
         "feature_type": feature_type,
         "tfidf_vec": _tfidf_vectorizer if feature_type == "tfidf" else None,
         "embedding_pipeline": _embedding_pipeline if feature_type == "word_embeddings" else None,
+        # Models with equal feature keys share an identical fitted transformer
+        "feature_key": feature_key,
     }
+    _dump_atomic(_trained_models[model_key], os.path.join(MODELS_DIR, f"{model_key}.joblib"))
 
     return {
         "model_key": model_key,
@@ -191,43 +389,98 @@ def train_model(model_key: str, X_train, X_test, y_train, y_test) -> dict:
     }
 
 
-def predict_text(model_key: str, text: str) -> dict:
-    """Predict a single text with a trained model."""
-    if model_key not in _trained_models:
-        raise ValueError(f"Model '{model_key}' is not trained yet. Train it first.")
+def train_model_job(model_key: str, X_train, X_test, y_train, y_test) -> tuple:
+    """
+    train_model for worker processes. Also returns the trained-model cache entry,
+    which the parent process installs with register_trained_model so it can predict.
+    """
+    result = train_model(model_key, X_train, X_test, y_train, y_test)
+    return result, _trained_models[model_key]
 
-    cached = _trained_models[model_key]
-    model = cached["model"]
-    feature_type = cached["feature_type"]
 
-    # Vectorize
-    if feature_type == "tfidf":
-        vec = cached["tfidf_vec"].transform([text])
-    else:
-        vec = cached["embedding_pipeline"].transform([text])
+def register_trained_model(model_key: str, entry: dict):
+    """Install a model trained in another process (see train_model_job)."""
+    _trained_models[model_key] = entry
 
-    prediction = int(model.predict(vec)[0])
 
-    confidence = None
+def _vectorize(cached: dict, texts: list):
+    if cached["feature_type"] == "tfidf":
+        return cached["tfidf_vec"].transform(texts)
+    return cached["embedding_pipeline"].transform(texts)
+
+
+def _predict_features(model_key: str, cached: dict, vec, texts: list) -> list:
+    """Predict every row of a feature matrix, returning one result dict per text."""
+    model = cached["model"]
+    predictions = model.predict(vec)
+
+    confidences = [None] * len(texts)
     if hasattr(model, "predict_proba"):
-        probas = model.predict_proba(vec)[0]
-        confidence = float(max(probas))
+        confidences = np.max(model.predict_proba(vec), axis=1)
 
-    return {
-        "model_key": model_key,
-        "text": text,
-        "prediction": prediction,
-        "label": "Cyberbullying" if prediction == 1 else "Not Cyberbullying",
-        "confidence": round(confidence, 4) if confidence else None,
-    }
+    results = []
+    for text, prediction, confidence in zip(texts, predictions, confidences):
+        prediction = int(prediction)
+        results.append({
+            "model_key": model_key,
+            "text": text,
+            "prediction": prediction,
+            "label": "Cyberbullying" if prediction == 1 else "Not Cyberbullying",
+            "confidence": round(float(confidence), 4) if confidence else None,
+        })
+    return results
+
+
+def preload_all_models() -> list:
+    """Load models saved by earlier training runs from MODELS_DIR; returns the loaded keys."""
+    loaded = []
+    for model_key in MODEL_CONFIGS:
+        path = os.path.join(MODELS_DIR, f"{model_key}.joblib")
+        if model_key in _trained_models or not os.path.exists(path):
+            continue
+        try:
+            _trained_models[model_key] = joblib.load(path)
+        except Exception:
+            # A stale or corrupt cache file must not stop the server from starting;
+            # the model simply needs to be trained again
+            logger.exception("Could not load saved model %s; deleting %s", model_key, path)
+            _remove_file(path)
+            continue
+        loaded.append(model_key)
+    return loaded
+
+
+def is_trained(model_key: str) -> bool:
+    return model_key in _trained_models
+
+
+def predict_text(model_key: str, text: str) -> dict:
+    """Predict a single text with a trained model."""
+    return predict_text_batch(model_key, [text])[0]
+
+
+def predict_text_batch(model_key: str, texts: list) -> list:
+    """Predict a batch of texts with a trained model using one transform and one predict call."""
+    if model_key not in _trained_models:
+        raise ValueError(f"Model '{model_key}' is not trained yet. Train it first.")
+
+    cached = _trained_models[model_key]
+    return _predict_features(model_key, cached, _vectorize(cached, texts), texts)
 
 
 def predict_all_models(text: str) -> list:
-    """Predict a single text with ALL trained models for comparison."""
+    """
+    Predict a single text with ALL trained models for comparison.
+    The text is vectorized once per distinct fitted transformer, not once per model.
+    """
     results = []
-    for model_key in _trained_models:
+    features = {}
+    for model_key, cached in list(_trained_models.items()):
         try:
-            result = predict_text(model_key, text)
+            feature_key = cached.get("feature_key") or model_key
+            if feature_key not in features:
+                features[feature_key] = _vectorize(cached, [text])
+            result = _predict_features(model_key, cached, features[feature_key], [text])[0]
             result["display_name"] = MODEL_CONFIGS[model_key]["display_name"]
             results.append(result)
         except Exception:
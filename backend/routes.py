@@ -3,190 +3,467 @@ API routes for the cyberbullying detection app.
 Provides dataset info, model training, comparison, and prediction endpoints.
 """
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import Optional
+import os
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from uuid import uuid4
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from functools import lru_cache
+import orjson
+from threadpoolctl import threadpool_limits
+from fastapi import APIRouter, BackgroundTasks
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, StringConstraints
+from typing import Annotated, Dict, List, Literal, Optional
 import data_loader
 import ml_pipeline
 import email_service
 
 router = APIRouter(prefix="/api")
+logger = logging.getLogger(__name__)
 
 # ─── Request / Response Models ──────────────────────────────────
 
-class TrainRequest(BaseModel):
-    model_key: str
-    dataset_id: str = "combined"  # "1", "2", or "combined"
+# Validated by pydantic before the handler runs; unknown values get a 422
+ModelKey = Literal[tuple(ml_pipeline.MODEL_CONFIGS)]  # type: ignore[valid-type]
+DatasetId = Literal["1", "2", "combined"]
 
-class TrainAllRequest(BaseModel):
-    dataset_id: str = "combined"
+class RequestModel(BaseModel):
+    """Base for request bodies: unknown keys are a 422, strings arrive stripped."""
+    model_config = ConfigDict(extra="forbid", frozen=True, str_strip_whitespace=True)
 
-class PredictRequest(BaseModel):
-    text: str
-    model_key: str
+class TrainRequest(RequestModel):
+    model_key: ModelKey
+    dataset_id: DatasetId = "combined"
 
-class PredictAllRequest(BaseModel):
-    text: str
+class TrainAllRequest(RequestModel):
+    dataset_id: DatasetId = "combined"
+
+# Bounds clean_text/vectorization cost per request; oversized or blank input is
+# rejected with a 422 during validation, before the handler runs
+MAX_TEXT_LENGTH = 10_000
+MAX_BATCH_SIZE = 1_000
+
+NonBlankText = Annotated[str, StringConstraints(min_length=1, max_length=MAX_TEXT_LENGTH,
+                                                strip_whitespace=True)]
+ShortText = Annotated[str, StringConstraints(max_length=64, strip_whitespace=True)]
+
+class PredictRequest(RequestModel):
+    text: NonBlankText
+    model_key: ModelKey
+
+class PredictBatchRequest(RequestModel):
+    texts: Annotated[List[NonBlankText], Field(min_length=1, max_length=MAX_BATCH_SIZE)]
+    model_key: ModelKey
+
+class PredictAllRequest(RequestModel):
+    text: NonBlankText
 
-class EmailAlertRequest(BaseModel):
+class EmailAlertRequest(RequestModel):
+    text: NonBlankText
+    label: ShortText
+    confidence: float = 0.0
+    model_name: ShortText = ""
+
+class Prediction(BaseModel):
+    model_key: str
     text: str
+    prediction: int
     label: str
-    confidence: float = 0.0
-    model_name: str = ""
+    confidence: Optional[float] = None
+    display_name: Optional[str] = None
+
+# The input text is echoed once per response, not on every prediction record
+class PredictResponse(BaseModel):
+    original_text: str
+    prediction: Prediction
+
+class PredictionsResponse(BaseModel):
+    original_text: Optional[str] = None
+    predictions: List[Prediction]
+
+class TrainJobResponse(BaseModel):
+    job_id: str
 
 # ─── In-memory results cache ───────────────────────────────────
 
-_comparison_results: list = []
+# model_key -> latest result; ranked by F1 on read in /results.
+# Replaced wholesale (never mutated in place) under _results_lock, which is held
+# only for the swap or snapshot itself.
+_comparison_results: Dict[str, dict] = {}
+_results_lock = threading.RLock()
+
+# /models response; rebuilt lazily after training registers new models
+_models_cache: Optional[dict] = None
+
+# ─── Background training jobs ──────────────────────────────────
+# Training runs in worker processes so it never pins an HTTP worker, with one task
+# per model so /train-all uses every core. Each job's public future resolves only
+# after its trained models are registered in this process, so a client that sees
+# "done" can predict immediately.
+
+def _init_train_worker():
+    """Limit each worker's BLAS/OpenMP pools to one thread to avoid oversubscription."""
+    global _worker_thread_limits
+    _worker_thread_limits = threadpool_limits(limits=1)
+
+
+# Workers are spawned, not forked: the pool starts lazily from a collector thread in a
+# process that already runs server and BLAS/OpenMP threads, where fork can deadlock.
+_train_pool = ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=_init_train_worker,
+                                  mp_context=multiprocessing.get_context("spawn"))
+_jobs: Dict[str, Future] = {}
+_job_finished: Dict[str, float] = {}   # job_id -> time.monotonic() when it finished
+
+# Finished jobs (and their result payloads) are kept this long for polling, then dropped
+JOB_TTL_S = 600
+
+
+def _evict_finished_jobs():
+    cutoff = time.monotonic() - JOB_TTL_S
+    for job_id, finished in list(_job_finished.items()):
+        if finished < cutoff:
+            _jobs.pop(job_id, None)
+            _job_finished.pop(job_id, None)
+
+
+@lru_cache(maxsize=4)
+def _cached_split(dataset_id: str):
+    """
+    Memoized data_loader.get_train_test_split. The same arrays are handed to every
+    caller, so they must be treated as read-only.
+    """
+    return data_loader.get_train_test_split(dataset_id)
+
+
+def _train_job(model_key: str, dataset_id: str, split: tuple):
+    """Worker: train one model on a pre-loaded split. Returns (result, trained-model entry)."""
+    X_train, X_test, y_train, y_test = split
+    result, entry = ml_pipeline.train_model_job(model_key, X_train, X_test, y_train, y_test)
+    result["dataset_id"] = dataset_id
+    return result, entry
+
+
+def _prepare_job(model_keys: list, split: tuple):
+    """
+    Worker: fit the features of every feature type used by model_keys once, before
+    the per-model tasks fan out and load them from the disk cache.
+    """
+    X_train, X_test, _, _ = split
+    ml_pipeline.prepare_features(
+        X_train, X_test, [ml_pipeline.MODEL_CONFIGS[key]["feature"] for key in model_keys]
+    )
+
+
+def _single_payload(results: list) -> dict:
+    return {"result": results[0]}
+
+
+def _ranked_payload(results: list) -> dict:
+    # Sort by F1 score (best first)
+    results.sort(key=lambda x: x["metrics"]["f1_score"], reverse=True)
+
+    # Mark the best model
+    if results:
+        results[0]["is_best"] = True
+
+    return {"results": results, "best_model": results[0] if results else None}
+
+
+def _update_single_result(payload: dict):
+    global _comparison_results
+    result = payload["result"]
+    with _results_lock:
+        _comparison_results = {**_comparison_results, result["model_key"]: result}
+
+
+def _update_all_results(payload: dict):
+    global _comparison_results
+    new_results = {r["model_key"]: r for r in payload["results"]}
+    with _results_lock:
+        _comparison_results = new_results
+
+
+def _invalidate_models_cache():
+    global _models_cache
+    with _results_lock:
+        _models_cache = None
+
+
+def _start_training(model_keys: list, dataset_id: str, make_payload, on_done) -> str:
+    """Submit one training task per model and return the job id tracking them."""
+    job_id = uuid4().hex
+    public: Future = Future()
+
+    def _collect():
+        try:
+            split = _cached_split(dataset_id)
+            if len(model_keys) > 1:
+                _train_pool.submit(_prepare_job, model_keys, split).result()
+            futures = [_train_pool.submit(_train_job, key, dataset_id, split) for key in model_keys]
+            results = []
+            for fut in as_completed(futures):
+                result, entry = fut.result()
+                ml_pipeline.register_trained_model(result["model_key"], entry)
+                _invalidate_models_cache()
+                results.append(result)
+            payload = make_payload(results)
+            on_done(payload)
+            public.set_result(payload)
+        except Exception as e:
+            public.set_exception(e)
+
+    _evict_finished_jobs()
+    _jobs[job_id] = public
+    public.add_done_callback(lambda _: _job_finished.__setitem__(job_id, time.monotonic()))
+    threading.Thread(target=_collect, daemon=True).start()
+    return job_id
+
+
+# clean_text is pure, so repeated prediction texts can reuse its output
+_clean_cache = lru_cache(maxsize=4096)(data_loader.clean_text)
+
+
+async def warm_caches():
+    """
+    Pay one-time costs before the first request: load saved models, trigger
+    clean_text's JIT/regex setup, and load the default train/test split.
+    The work is blocking, so it runs in worker threads, off the event loop.
+    """
+    await asyncio.to_thread(ml_pipeline.preload_all_models)
+    await asyncio.to_thread(data_loader.clean_text, "hello world")
+    try:
+        await asyncio.to_thread(_cached_split, "combined")
+    except Exception:
+        logger.exception("Could not pre-load the combined dataset split")
+
+
+def _error(status_code: int, detail: str) -> JSONResponse:
+    """Error response returned directly, without raising through the exception middleware."""
+    return JSONResponse(status_code=status_code, content={"detail": detail})
 
 
 # ─── Endpoints ──────────────────────────────────────────────────
 
 @router.get("/datasets")
-def get_datasets():
+async def get_datasets():
     """Return stats for all datasets."""
     try:
         stats = []
         for did in ["1", "2", "combined"]:
-            stats.append(data_loader.get_dataset_stats(did))
+            # Loading a dataset parses CSVs, so keep it off the event loop
+            stats.append(await asyncio.to_thread(data_loader.get_dataset_stats, did))
         return {"datasets": stats}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.exception("Failed to load dataset stats")
+        return _error(500, str(e))
 
 
 @router.get("/models")
-def get_models():
+async def get_models():
     """Return all available model configurations and their training status."""
-    return {"models": ml_pipeline.get_available_models()}
+    global _models_cache
+    with _results_lock:
+        if _models_cache is None:
+            _models_cache = {"models": ml_pipeline.get_available_models()}
+        return _models_cache
 
 
-@router.post("/train")
-def train_model(req: TrainRequest):
-    """Train a single model and return its metrics."""
-    global _comparison_results
-
-    if req.model_key not in ml_pipeline.MODEL_CONFIGS:
-        raise HTTPException(status_code=400, detail=f"Unknown model: {req.model_key}")
+@router.post("/train", response_model=TrainJobResponse)
+async def train_model(req: TrainRequest):
+    """Start training a single model; poll /train/{job_id} for its metrics."""
+    job_id = _start_training([req.model_key], req.dataset_id, _single_payload, _update_single_result)
+    return {"job_id": job_id}
 
-    try:
-        X_train, X_test, y_train, y_test = data_loader.get_train_test_split(req.dataset_id)
-        result = ml_pipeline.train_model(req.model_key, X_train, X_test, y_train, y_test)
-        result["dataset_id"] = req.dataset_id
 
-        # Update comparison cache
-        _comparison_results = [r for r in _comparison_results if r["model_key"] != req.model_key]
-        _comparison_results.append(result)
-        _comparison_results.sort(key=lambda x: x["metrics"]["f1_score"], reverse=True)
+@router.post("/train-all", response_model=TrainJobResponse)
+async def train_all(req: TrainAllRequest):
+    """Start training all 6 models; poll /train/{job_id} for the comparison results."""
+    job_id = _start_training(list(ml_pipeline.MODEL_CONFIGS), req.dataset_id,
+                             _ranked_payload, _update_all_results)
+    return {"job_id": job_id}
 
-        return {"result": result}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
 
+# Strong references to running stream trainings; asyncio keeps only weak ones
+_stream_tasks: set = set()
 
-@router.post("/train-all")
-def train_all(req: TrainAllRequest):
-    """Train all 6 models and return comparison results."""
-    global _comparison_results
 
+async def _train_streamed(model_keys: list, dataset_id: str, split: tuple, queue: asyncio.Queue):
+    """
+    Train model_keys for /train-all/stream, putting each result on queue as its model
+    finishes, then None once all results are stored (or the first exception instead).
+    Runs as its own task so models are registered and stored even if the client
+    disconnects or another model fails.
+    """
+    loop = asyncio.get_running_loop()
     try:
-        X_train, X_test, y_train, y_test = data_loader.get_train_test_split(req.dataset_id)
-
-        results = []
-        for model_key in ml_pipeline.MODEL_CONFIGS:
-            result = ml_pipeline.train_model(model_key, X_train, X_test, y_train, y_test)
-            result["dataset_id"] = req.dataset_id
-            results.append(result)
-
-        # Sort by F1 score (best first)
-        results.sort(key=lambda x: x["metrics"]["f1_score"], reverse=True)
-
-        # Mark the best model
-        if results:
-            results[0]["is_best"] = True
-
-        _comparison_results = results
-        return {"results": results, "best_model": results[0] if results else None}
+        await loop.run_in_executor(_train_pool, _prepare_job, model_keys, split)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.post("/predict")
+        queue.put_nowait(e)
+        return
+
+    tasks = [loop.run_in_executor(_train_pool, _train_job, key, dataset_id, split)
+             for key in model_keys]
+    results, error = [], None
+    for next_done in asyncio.as_completed(tasks):
+        try:
+            result, entry = await next_done
+        except Exception as e:
+            if error is None:
+                error = e
+                queue.put_nowait(e)
+            continue
+        ml_pipeline.register_trained_model(result["model_key"], entry)
+        _invalidate_models_cache()
+        results.append(result)
+        if error is None:
+            queue.put_nowait(result)
+
+    if error is None:
+        _update_all_results(_ranked_payload(results))
+        queue.put_nowait(None)
+
+
+@router.post("/train-all/stream")
+async def train_all_stream(req: TrainAllRequest):
+    """
+    Train all models, streaming each result as a Server-Sent Event as soon as its
+    model finishes, followed by a final "done" event.
+    """
+    split = await asyncio.to_thread(_cached_split, req.dataset_id)
+    queue: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(
+        _train_streamed(list(ml_pipeline.MODEL_CONFIGS), req.dataset_id, split, queue)
+    )
+    _stream_tasks.add(task)
+    task.add_done_callback(_stream_tasks.discard)
+
+    async def events():
+        while True:
+            item = await queue.get()
+            if item is None:
+                yield "data: done\n\n"
+                return
+            if isinstance(item, Exception):
+                yield f"event: error\ndata: {orjson.dumps({'detail': str(item)}).decode()}\n\n"
+                return
+            yield f"data: {orjson.dumps(item, option=orjson.OPT_SERIALIZE_NUMPY).decode()}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@router.get("/train/{job_id}", response_model=None)
+async def get_train_job(job_id: str):
+    """
+    Return the status of a training job, with its results once finished.
+    Finished jobs can be polled for JOB_TTL_S seconds, after which they are a 404.
+    """
+    _evict_finished_jobs()
+    fut = _jobs.get(job_id)
+    if fut is None:
+        return _error(404, f"Unknown training job: {job_id}")
+    if not fut.done():
+        return {"job_id": job_id, "done": False, "result": None}
+    if fut.exception() is not None:
+        return _error(500, str(fut.exception()))
+    # Metric payloads are free-form; hand them straight to orjson without re-encoding
+    return ORJSONResponse({"job_id": job_id, "done": True, "result": fut.result()})
+
+
+@router.post("/cache/clear")
+async def clear_cache():
+    """Drop memoized train/test splits, e.g. after the datasets on disk change."""
+    _cached_split.cache_clear()
+    return {"success": True}
+
+
+@router.post("/predict", response_model=PredictResponse, response_model_exclude_none=True)
 def predict(req: PredictRequest):
     """Predict cyberbullying on custom text using a trained model."""
-    if not req.text.strip():
-        raise HTTPException(status_code=400, detail="Text cannot be empty")
+    if not ml_pipeline.is_trained(req.model_key):
+        return _error(400, f"Model '{req.model_key}' is not trained yet. Train it first.")
 
     try:
         # Clean the input text
-        cleaned = data_loader.clean_text(req.text)
+        cleaned = _clean_cache(req.text)
         result = ml_pipeline.predict_text(req.model_key, cleaned)
-        result["original_text"] = req.text
-        return {"prediction": result}
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        return {"original_text": req.text, "prediction": result}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.exception("Prediction failed")
+        return _error(500, str(e))
+
 
+@router.post("/predict-batch", response_model=PredictionsResponse, response_model_exclude_none=True)
+def predict_batch(req: PredictBatchRequest):
+    """Predict cyberbullying for a list of texts with one model; results align with the inputs."""
+    if not ml_pipeline.is_trained(req.model_key):
+        return _error(400, f"Model '{req.model_key}' is not trained yet. Train it first.")
 
-@router.post("/predict-all")
+    try:
+        cleaned = [_clean_cache(t) for t in req.texts]
+        results = ml_pipeline.predict_text_batch(req.model_key, cleaned)
+        return {"predictions": results}
+    except Exception as e:
+        logger.exception("Batch prediction failed")
+        return _error(500, str(e))
+
+
+@router.post("/predict-all", response_model=PredictionsResponse, response_model_exclude_none=True)
 def predict_all(req: PredictAllRequest):
     """Predict cyberbullying using ALL trained models for comparison."""
-    if not req.text.strip():
-        raise HTTPException(status_code=400, detail="Text cannot be empty")
-
     try:
-        cleaned = data_loader.clean_text(req.text)
+        cleaned = _clean_cache(req.text)
         results = ml_pipeline.predict_all_models(cleaned)
-        for r in results:
-            r["original_text"] = req.text
-        return {"predictions": results}
+        return {"original_text": req.text, "predictions": results}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.exception("Prediction with all models failed")
+        return _error(500, str(e))
 
 
-@router.get("/results")
-def get_results():
+@router.get("/results", response_model=None)
+async def get_results():
     """Return cached comparison results."""
-    return {
-        "results": _comparison_results,
-        "best_model": _comparison_results[0] if _comparison_results else None,
-    }
+    with _results_lock:
+        snapshot = list(_comparison_results.values())
+    ranked = sorted(snapshot, key=lambda x: x["metrics"]["f1_score"], reverse=True)
+    return ORJSONResponse({"results": ranked, "best_model": ranked[0] if ranked else None})
 
 
 # ─── Email Configuration Endpoints ─────────────────────────────
 
 @router.post("/email/config")
-def save_email_config(config: email_service.EmailConfig):
+async def save_email_config(config: email_service.EmailConfig):
     """Save SMTP email configuration."""
-    try:
-        email_service.save_config(config)
-        return {"success": True, "message": "Email configuration saved successfully"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    email_service.save_config(config)
+    return {"success": True, "message": "Email configuration saved successfully"}
 
 
 @router.get("/email/config")
-def get_email_config():
+async def get_email_config():
     """Return current email config (password masked)."""
     config = email_service.get_config()
     return {"config": config}
 
 
-@router.post("/email/send-alert")
-def send_email_alert(req: EmailAlertRequest):
-    """Send a cyberbullying alert email."""
+@router.post("/email/send-alert", status_code=202)
+async def send_email_alert(req: EmailAlertRequest, background_tasks: BackgroundTasks):
+    """
+    Queue a cyberbullying alert email (202 Accepted). Delivery runs after the response
+    is sent, on the threadpool, reusing email_service's pooled SMTP connections.
+    """
     try:
-        result = email_service.send_alert_email(
-            text=req.text,
-            label=req.label,
-            confidence=req.confidence,
-            model_name=req.model_name,
-        )
-        if not result["success"]:
-            raise HTTPException(status_code=500, detail=result["message"])
-        return result
+        email_service.require_config()
     except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        return _error(400, str(e))
+
+    background_tasks.add_task(
+        email_service.send_alert_email,
+        text=req.text,
+        label=req.label,
+        confidence=req.confidence,
+        model_name=req.model_name,
+    )
+    return {"success": True, "queued": True, "message": "Alert email queued for delivery"}
@@ -0,0 +1,42 @@
+"""
+clean_text is memoized for prediction and has several implementations (Numba byte
+filter, stdlib regex, Arrow/RE2 column path); they must agree, or training and
+prediction text would be cleaned differently.
+"""
+
+import pandas as pd
+import pytest
+
+import data_loader
+import routes
+
+SAMPLES = [
+    "Hello World!!  You're SO dumb...",
+    "hello\xa0world",
+    "Check this http://t.co/abc123 and www.example.com/x NOW",
+    "@user_1 @Other you are a loser",
+    "caf\xe9 na\xefve “quoted” \U0001F600",
+    "tabs\tand\nnewlines\r\nand\x0bvertical\x0cfeeds",
+    "   \t\n  ",
+    "",
+]
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_clean_cache_is_pure(text):
+    expected = data_loader.clean_text(text)
+    assert routes._clean_cache(text) == expected
+    assert routes._clean_cache(text) == expected
+    assert data_loader.clean_text(text) == expected
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_clean_text_matches_column_path(text):
+    assert data_loader.clean_text(text) == data_loader.clean_text_series(pd.Series([text]))[0]
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_byte_filter_matches_regex_path(text, monkeypatch):
+    expected = data_loader.clean_text(text)
+    monkeypatch.setattr(data_loader, "_filter_ascii", None)
+    assert data_loader.clean_text(text) == expected
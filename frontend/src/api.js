@@ -12,6 +12,19 @@ export async function fetchModels() {
     return res.json();
 }
 
+async function waitForTrainingJob(jobId, intervalMs = 1000) {
+    while (true) {
+        const res = await fetch(`${API_BASE}/train/${jobId}`);
+        if (!res.ok) {
+            const err = await res.json().catch(() => ({}));
+            throw new Error(err.detail || 'Training failed');
+        }
+        const data = await res.json();
+        if (data.done) return data.result;
+        await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    }
+}
+
 export async function trainModel(modelKey, datasetId = 'combined') {
     const res = await fetch(`${API_BASE}/train`, {
         method: 'POST',
@@ -22,7 +35,8 @@ export async function trainModel(modelKey, datasetId = 'combined') {
         const err = await res.json().catch(() => ({}));
         throw new Error(err.detail || 'Training failed');
     }
-    return res.json();
+    const { job_id } = await res.json();
+    return waitForTrainingJob(job_id);
 }
 
 export async function trainAll(datasetId = 'combined') {
@@ -35,7 +49,8 @@ export async function trainAll(datasetId = 'combined') {
         const err = await res.json().catch(() => ({}));
         throw new Error(err.detail || 'Training failed');
     }
-    return res.json();
+    const { job_id } = await res.json();
+    return waitForTrainingJob(job_id);
 }
 
 export async function predictText(text, modelKey) {
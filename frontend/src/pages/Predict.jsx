@@ -34,7 +34,7 @@ export default function Predict({ results }) {
 
         try {
             const data = await predictText(text, modelKey)
-            setPrediction(data.prediction)
+            setPrediction({ ...data.prediction, original_text: data.original_text })
 
             // Show popup alert if cyberbullying detected
             if (data.prediction.prediction === 1) {